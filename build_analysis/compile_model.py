@@ -0,0 +1,295 @@
+import itertools
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .dependencies import Deps
+
+__all__ = [
+    'CompileTimeModel',
+    'fit_compile_time_model',
+    'is_compile_output',
+]
+
+
+def is_compile_output(target: str) -> bool:
+    """Whether a target is the object file output of a compile command"""
+    return target.endswith('.o')
+
+
+@dataclass
+class CompileTimeModel:
+    """Linear model of compile time in terms of the headers a target includes
+
+    duration(target) ~= intercept + sum(coefficients[h] for h in deps[target])
+    """
+    inputs: List[str]
+    coefficients: np.ndarray
+    intercept: float
+    # Fit quality on targets held out from fitting
+    holdout_r2: float
+    holdout_rmse: float
+    num_samples: int
+    num_holdout: int
+    converged: bool
+    input_index: Dict[str, int] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.input_index = {inp: i for i, inp in enumerate(self.inputs)}
+
+    def summary(self) -> str:
+        if self.num_holdout == 0:
+            msg = f'fit quality not measured, {self.num_samples} targets'
+        else:
+            msg = (f'R^2 = {self.holdout_r2:.3f}, RMSE = {self.holdout_rmse:.0f}ms '
+                   f'on {self.num_holdout} held-out of {self.num_samples} targets')
+        if not self.converged:
+            msg += ' (solver did not converge)'
+        return msg
+
+    def input_costs(self) -> Dict[str, float]:
+        """Marginal compile cost (in ms) of each input per dependant target"""
+        return dict(zip(self.inputs, self.coefficients.tolist()))
+
+    def predict(self, inputs: List[str]) -> float:
+        """Predict the compile time of a target from its list of inputs
+
+        NOTE: Inputs not seen during fitting are assumed to cost nothing
+        """
+        index = [self.input_index[inp] for inp in set(inputs)
+                 if inp in self.input_index]
+        total = self.intercept + self.coefficients[index].sum()
+        return max(float(total), 0.0)
+
+    def fill_missing(self, deps: Deps, time_map: Dict[str, int],
+                     targets: List[str]) -> Dict[str, int]:
+        """Return predicted compile times for targets absent from time_map"""
+        return {target: int(round(self.predict(deps[target])))
+                for target in targets if target not in time_map}
+
+
+@dataclass
+class Incidence:
+    """Sparse 0/1 target x input matrix in compressed row form"""
+    indptr: np.ndarray
+    cols: np.ndarray
+    num_cols: int
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.indptr) - 1
+
+    def row_lengths(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def col_counts(self) -> np.ndarray:
+        return np.bincount(self.cols, minlength=self.num_cols)
+
+    def matvec(self, x: np.ndarray) -> np.ndarray:
+        out = np.zeros(self.num_rows)
+        if len(self.cols) > 0:
+            # reduceat can't produce empty sums, so skip empty rows
+            nonempty = self.indptr[:-1] < self.indptr[1:]
+            out[nonempty] = np.add.reduceat(x[self.cols], self.indptr[:-1][nonempty])
+        return out
+
+    def rmatvec(self, r: np.ndarray) -> np.ndarray:
+        return np.bincount(self.cols, weights=np.repeat(r, self.row_lengths()),
+                           minlength=self.num_cols)
+
+    def select_rows(self, mask: np.ndarray) -> 'Incidence':
+        lengths = self.row_lengths()[mask]
+        indptr = np.zeros(len(lengths) + 1, dtype=np.intp)
+        np.cumsum(lengths, out=indptr[1:])
+        return Incidence(indptr=indptr,
+                         cols=self.cols[np.repeat(mask, self.row_lengths())],
+                         num_cols=self.num_cols)
+
+
+def build_incidence(deps: Deps, targets: List[str]) -> Tuple[List[str], Incidence]:
+    """Build the sparse target x input matrix
+
+    Returns the list of inputs (column labels) and the matrix, with duplicate
+    inputs of a target counted once.
+    """
+    lengths = np.fromiter((len(deps[t]) for t in targets), dtype=np.intp,
+                          count=len(targets))
+    # Hash every input once, recording the position of its first occurrence
+    first_seen: Dict[str, int] = {}
+    first = np.fromiter(
+        map(first_seen.setdefault,
+            itertools.chain.from_iterable(deps[t] for t in targets),
+            itertools.count()),
+        dtype=np.intp, count=int(lengths.sum()))
+    inputs = list(first_seen.keys())
+    column_of_position = np.empty(len(first), dtype=np.intp)
+    column_of_position[np.fromiter(first_seen.values(), dtype=np.intp,
+                                   count=len(inputs))] = np.arange(len(inputs))
+    cols = column_of_position[first]
+
+    # Sort by (row, col) and drop duplicates
+    rows = np.repeat(np.arange(len(targets), dtype=np.intp), lengths)
+    keys = np.sort(rows * len(inputs) + cols)
+    keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))] \
+        if len(keys) > 0 else keys
+    rows, cols = np.divmod(keys, max(len(inputs), 1))
+
+    indptr = np.zeros(len(targets) + 1, dtype=np.intp)
+    np.cumsum(np.bincount(rows, minlength=len(targets)), out=indptr[1:])
+    return inputs, Incidence(indptr=indptr, cols=cols, num_cols=len(inputs))
+
+
+def solve_ridge(A: Incidence, y: np.ndarray, alpha: float, tol: float,
+                max_iter: int, penalize_intercept: bool = False,
+                x0: Optional[np.ndarray] = None) -> Tuple[np.ndarray, float, bool]:
+    """Solve min |A x + b - y|^2 + alpha |x|^2 for a 0/1 sparse matrix A
+
+    Uses conjugate gradients on the normal equations with a Jacobi
+    preconditioner, so each iteration costs two passes over the non-zeros of
+    A. The intercept b is not penalised unless penalize_intercept is set.
+    When it isn't, the columns and y are centered so b drops out of the
+    iteration and doesn't hurt its conditioning.
+    Stops once the preconditioned residual falls by a factor of tol relative
+    to the residual at x = 0. x0 optionally gives a starting point for x.
+
+    Returns x, b and whether the solver converged to within tol.
+    """
+    num_rows, num_cols = A.num_rows, A.num_cols
+    counts = A.col_counts().astype(np.float64)
+
+    if penalize_intercept:
+        # Treat b as an extra column of ones with the same penalty
+        means = np.zeros(num_cols)
+        y_mean = 0.0
+        diag = np.append(counts, num_rows) + alpha
+    else:
+        means = counts / max(num_rows, 1)
+        y_mean = y.mean() if num_rows > 0 else 0.0
+        diag = np.append(counts - counts * means, 1.0) + alpha
+    y = y - y_mean
+    penalty = np.full(num_cols + 1, alpha)
+    penalty[-1] = alpha if penalize_intercept else 0.0
+    inv_diag = 1.0 / diag
+
+    def matvec(x: np.ndarray) -> np.ndarray:
+        # [A - 1 means^T, 1] @ [x, b]
+        return A.matvec(x[:-1]) + (x[-1] - means @ x[:-1])
+
+    def rmatvec(r: np.ndarray) -> np.ndarray:
+        # [A - 1 means^T, 1]^T @ r
+        r_sum = r.sum()
+        return np.append(A.rmatvec(r) - means * r_sum, r_sum)
+
+    def normal_matvec(x: np.ndarray) -> np.ndarray:
+        out = rmatvec(matvec(x)) + penalty * x
+        if not penalize_intercept:
+            out[-1] = 0.0
+        return out
+
+    rhs = rmatvec(y)
+    if not penalize_intercept:
+        # b is exactly zero for centered data
+        rhs[-1] = 0.0
+    ref_norm = np.sqrt(rhs @ (inv_diag * rhs))
+
+    x = np.zeros(num_cols + 1)
+    if x0 is not None:
+        x[:-1] = x0
+        r = rhs - normal_matvec(x)
+    else:
+        r = rhs.copy()
+    if not penalize_intercept:
+        r[-1] = 0.0
+
+    z = inv_diag * r
+    p = z.copy()
+    rz = r @ z
+    converged = False
+    for _ in range(max_iter + 1):
+        if np.sqrt(max(rz, 0.0)) <= tol * ref_norm:
+            converged = True
+            break
+        Ap = normal_matvec(p)
+        step = rz / (p @ Ap)
+        x += step * p
+        r -= step * Ap
+        z = inv_diag * r
+        rz_new = r @ z
+        p = z + (rz_new / rz) * p
+        rz = rz_new
+
+    intercept = x[-1] + y_mean - means @ x[:-1]
+    return x[:-1], intercept, converged
+
+
+def fit_compile_time_model(deps: Deps, time_map: Dict[str, int],
+                           targets: List[str], alpha: float = 10.0,
+                           penalize_intercept: bool = False,
+                           holdout: float = 0.1, seed: int = 0,
+                           tol: float = 1e-5,
+                           max_iter: int = 1000) -> CompileTimeModel:
+    """Fit per-input marginal compile costs from observed compile times
+
+    Models each target's duration as a constant plus the sum of a cost for
+    each of its inputs, fitted by ridge regression over those of targets that
+    have a time in time_map. targets should only contain compile outputs and
+    deps should already include transitive dependencies.
+
+    The constant is hard to tell apart from inputs included by almost every
+    target, so their cost tends to be underestimated and moved into the
+    constant. With penalize_intercept their shared cost is instead split more
+    evenly between them and the constant.
+
+    Fit quality is measured on a random holdout fraction of the samples, then
+    the model is refitted on all samples.
+    """
+    targets = [t for t in targets if t in time_map]
+    if len(targets) == 0:
+        raise RuntimeError("No build time info for any target")
+
+    y = np.array([time_map[t] for t in targets], dtype=np.float64)
+    inputs, A = build_incidence(deps, targets)
+
+    rng = np.random.default_rng(seed)
+    num_holdout = int(holdout * len(targets))
+    is_holdout = np.zeros(len(targets), dtype=bool)
+    is_holdout[rng.choice(len(targets), num_holdout, replace=False)] = True
+
+    x0 = None
+    holdout_converged = True
+    holdout_r2 = holdout_rmse = float('nan')
+    if 0 < num_holdout < len(targets):
+        coefficients, intercept, holdout_converged = solve_ridge(
+            A.select_rows(~is_holdout), y[~is_holdout], alpha, tol, max_iter,
+            penalize_intercept)
+        x0 = coefficients
+
+        y_test = y[is_holdout]
+        residual = y_test - (A.select_rows(is_holdout).matvec(coefficients)
+                             + intercept)
+        ss_res = residual @ residual
+        ss_tot = ((y_test - y_test.mean()) ** 2).sum()
+        holdout_r2 = float(1.0 - ss_res / ss_tot) if ss_tot > 0 else float('nan')
+        holdout_rmse = float(np.sqrt(ss_res / num_holdout))
+    else:
+        num_holdout = 0
+
+    coefficients, intercept, converged = solve_ridge(
+        A, y, alpha, tol, max_iter, penalize_intercept, x0=x0)
+    converged = converged and holdout_converged
+    if not converged:
+        print(f"Warning: compile time model did not converge within "
+              f"{max_iter} iterations", file=sys.stderr)
+
+    return CompileTimeModel(
+        inputs=inputs,
+        coefficients=coefficients,
+        intercept=float(intercept),
+        holdout_r2=holdout_r2,
+        holdout_rmse=holdout_rmse,
+        num_samples=len(targets),
+        num_holdout=num_holdout,
+        converged=converged,
+    )
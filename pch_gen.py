@@ -18,6 +18,7 @@ from typing import Dict, List, Set
 
 from build_analysis.dependencies import get_dependencies, invert_dependencies
 from build_analysis.compile_time import get_compile_times
+from build_analysis.compile_model import fit_compile_time_model, is_compile_output
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -26,6 +27,14 @@ def parse_args():
     parser.add_argument('--trace', type=str, help='Build trace file')
     parser.add_argument('--target', type=str, nargs='*', help='Target to analyse', default=[])
     parser.add_argument('--threshold', type=float, default=0.95)
+    parser.add_argument('--marginal_cost', action='store_true',
+                        help='Rank headers by fitted per-header compile cost '
+                        'instead of the total time of dependant targets. The '
+                        'cost of headers included by almost every target is '
+                        'hard to separate, so it is shared evenly between them '
+                        'and the per-target constant.')
+    parser.add_argument('--alpha', type=float, default=10.0,
+                        help='Ridge penalty for the compile time model')
     args = parser.parse_args()
     if args.ninja is None:
         args.ninja = shutil.which('ninja')
@@ -60,6 +69,12 @@ for output, inputs in deps.items():
 
 with open(args.trace, 'r') as f:
     time_map = get_compile_times(f)
+compile_targets = [output for output in deps.keys() if is_compile_output(output)]
+model = fit_compile_time_model(deps, time_map, compile_targets, alpha=args.alpha,
+                               penalize_intercept=args.marginal_cost)
+print(f'// Compile time model: {model.summary()}')
+predicted_time_map = {**time_map, **model.fill_missing(deps, time_map, compile_targets)}
+
 min_time = float('inf')
 min_output = None
 for output in deps.keys():
@@ -112,11 +127,19 @@ include_paths.sort(key=lambda x: len(x.parts), reverse=True)
 header_cost = defaultdict(lambda: 0)
 
 dependants_map = invert_dependencies(deps)
-for in_file, out_files in dependants_map.items():
-    out_cost = sum(time_map.get(output, 0) for output in out_files)
-    header_cost[in_file] += out_cost
+if args.marginal_cost:
+    input_costs = model.input_costs()
+    for in_file, out_files in dependants_map.items():
+        header_cost[in_file] += input_costs.get(in_file, 0) * len(out_files)
+else:
+    for in_file, out_files in dependants_map.items():
+        out_cost = sum(predicted_time_map.get(output, 0) for output in out_files)
+        header_cost[in_file] += out_cost
 
 max_cost = max(header_cost.values())
+if max_cost <= 0:
+    print('Error: no header has a positive estimated cost', file=sys.stderr)
+    sys.exit(1)
 cost_cutoff = args.threshold * max_cost
 
 pch_headers = set(PurePath(header) for header, cost in header_cost.items() if cost > cost_cutoff)
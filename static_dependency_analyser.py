@@ -15,6 +15,7 @@ from build_analysis.dependencies import *
 from build_analysis.commit_db import CommitDb, determine_update_frequencies
 from build_analysis.utils import format_timestamp_ms
 from build_analysis.compile_time import get_compile_times
+from build_analysis.compile_model import fit_compile_time_model, is_compile_output
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -24,6 +25,8 @@ def parse_args():
     parser.add_argument('--commit_db', type=str, help='Commit database path')
     parser.add_argument('--trace', type=str, help='Build trace file')
     parser.add_argument('--target', type=str, nargs='*', help='Target to analyse', default=[])
+    parser.add_argument('--alpha', type=float, default=10.0,
+                        help='Ridge penalty for the compile time model')
     args = parser.parse_args()
     if args.ninja is None:
         args.ninja = shutil.which('ninja')
@@ -80,6 +83,12 @@ with open(args.trace, 'r') as f:
 phony_targets = get_targets(args.ninja, args.build_dir, ['rule', 'phony'])
 time_map.update({target: 0 for target in phony_targets})
 
+# Estimate build times for targets missing from the trace
+compile_targets = [target for target in deps.keys() if is_compile_output(target)]
+model = fit_compile_time_model(deps, time_map, compile_targets, alpha=args.alpha)
+print(f'Compile time model: {model.summary()}', file=sys.stderr)
+time_map.update(model.fill_missing(deps, time_map, compile_targets))
+
 in_files = dependants_map['../aten/src/ATen/native/native_functions.yaml']
 in_files.sort(key=lambda x: time_map.get(x, 0), reverse=True)
 for i, in_file in enumerate(in_files[:20]):
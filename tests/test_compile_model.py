@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+
+from build_analysis.compile_model import (
+    build_incidence, fit_compile_time_model, solve_ridge)
+
+
+def dense_ridge(A, y, alpha, penalize_intercept=False):
+    # Ridge with an intercept, as an augmented least squares problem
+    num_rows, num_cols = A.shape
+    design = np.hstack([A, np.ones((num_rows, 1))])
+    reg = np.sqrt(alpha) * np.eye(num_cols + 1)
+    if not penalize_intercept:
+        reg = reg[:-1]
+    solution, *_ = np.linalg.lstsq(
+        np.vstack([design, reg]), np.concatenate([y, np.zeros(len(reg))]),
+        rcond=None)
+    return solution[:-1], solution[-1]
+
+
+def to_deps(A):
+    return {f'{i}.o': [f'{j}.h' for j in np.nonzero(row)[0]]
+            for i, row in enumerate(A)}
+
+
+def make_skewed(num_targets, num_headers=200, num_universal=10, noise=5.0,
+                seed=0):
+    """Targets whose headers follow a power law in popularity, plus a few
+    headers included by nearly every target"""
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, num_headers + 1) ** 0.7
+    popularity[:num_universal] = 0.97
+    A = rng.random((num_targets, num_headers)) < popularity
+    A = A.astype(np.float64)
+    cost = rng.exponential(20, num_headers)
+    cost[:num_universal] = 200
+    y = 1000 + A @ cost + rng.normal(0, noise, num_targets)
+    return A, y, cost
+
+
+@pytest.mark.parametrize('alpha', [0.1, 1.0, 10.0])
+@pytest.mark.parametrize('penalize_intercept', [False, True])
+def test_solve_ridge_matches_dense(alpha, penalize_intercept):
+    rng = np.random.default_rng(0)
+    A = (rng.random((40, 25)) < 0.3).astype(np.float64)
+    y = rng.random(40) * 100
+    inputs, incidence = build_incidence(to_deps(A),
+                                        [f'{i}.o' for i in range(40)])
+    order = [int(h[:-2]) for h in inputs]
+
+    x, b, converged = solve_ridge(incidence, y, alpha, tol=1e-12,
+                                  max_iter=1000,
+                                  penalize_intercept=penalize_intercept)
+    expected_x, expected_b = dense_ridge(A, y, alpha, penalize_intercept)
+
+    assert converged
+    np.testing.assert_allclose(x, expected_x[order], rtol=1e-6, atol=1e-6)
+    assert b == pytest.approx(expected_b, rel=1e-6)
+
+
+def test_fit_defaults_match_dense():
+    A, y, _ = make_skewed(2000)
+    deps = to_deps(A)
+    time_map = {f'{i}.o': t for i, t in enumerate(y)}
+    model = fit_compile_time_model(deps, time_map, list(deps.keys()))
+    expected_x, expected_b = dense_ridge(A, y, 10.0)
+
+    assert model.converged
+    x = np.array([model.input_costs()[f'{j}.h'] for j in range(A.shape[1])])
+    assert np.linalg.norm(x - expected_x) <= 1e-3 * np.linalg.norm(expected_x)
+    assert model.intercept == pytest.approx(expected_b, rel=1e-3)
+
+
+def test_fit_skewed_popularity():
+    A, y, cost = make_skewed(2000)
+    deps = to_deps(A)
+    time_map = {f'{i}.o': t for i, t in enumerate(y)}
+    model = fit_compile_time_model(deps, time_map, list(deps.keys()))
+    costs = model.input_costs()
+
+    assert model.holdout_r2 > 0.9
+    # Headers included by a reasonable fraction of targets are recovered
+    common = [j for j in range(10, A.shape[1]) if 0.05 < A[:, j].mean() < 0.9]
+    assert len(common) > 10
+    errors = [costs[f'{j}.h'] - cost[j] for j in common]
+    assert np.abs(errors).max() < 10
+
+    # Near-universal headers still get most of their cost
+    for j in range(10):
+        assert costs[f'{j}.h'] > 100
+
+
+def test_fit_reports_non_convergence():
+    A, y, _ = make_skewed(200)
+    deps = to_deps(A)
+    time_map = {f'{i}.o': t for i, t in enumerate(y)}
+    model = fit_compile_time_model(deps, time_map, list(deps.keys()),
+                                   max_iter=1)
+    assert not model.converged
+    assert 'did not converge' in model.summary()
+
+
+def test_build_incidence_empty_inputs():
+    deps = {'a.o': ['x.h', 'y.h'], 'b.o': [], 'c.o': ['y.h', 'y.h']}
+    inputs, A = build_incidence(deps, list(deps.keys()))
+    assert inputs == ['x.h', 'y.h']
+    assert A.indptr.tolist() == [0, 2, 2, 3]
+    assert A.cols.tolist() == [0, 1, 1]
+    assert A.matvec(np.array([1.0, 2.0])).tolist() == [3.0, 0.0, 2.0]
+    assert A.rmatvec(np.array([1.0, 5.0, 2.0])).tolist() == [1.0, 3.0]
+
+
+def test_fit_single_target():
+    model = fit_compile_time_model({'a.o': ['x.h']}, {'a.o': 100}, ['a.o'])
+    assert model.num_samples == 1
+    assert model.num_holdout == 0
+    assert model.converged
+    assert model.predict(['x.h']) == pytest.approx(100)
+    assert 'not measured' in model.summary()
+
+
+def test_fit_excludes_untimed_and_keeps_zero_times():
+    deps = {
+        'a.o': ['x.h'],
+        'b.o': [],
+        'c.o': ['x.h'],
+        'lib.so': ['a.o', 'x.h'],
+    }
+    time_map = {'a.o': 0, 'b.o': 10, 'lib.so': 1000}
+    model = fit_compile_time_model(deps, time_map, ['a.o', 'b.o', 'c.o'],
+                                   holdout=0)
+    assert model.num_samples == 2
+    assert 'a.o' not in model.inputs
+    assert model.predict([]) == pytest.approx(model.intercept)
+    assert model.fill_missing(deps, time_map, ['a.o', 'b.o', 'c.o']) == {
+        'c.o': int(round(model.predict(['x.h'])))}